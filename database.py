@@ -1,11 +1,11 @@
 """
 Database Helper Functions
 
-MongoDB helper functions ready to use in your backend code.
+Async MongoDB (Motor) helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,11 +22,20 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # One client per process, shared by all requests. Keep the pool bounded —
+    # oversized pools hurt as much as undersized ones — and fail fast when the
+    # server is unreachable instead of queueing requests for 30s.
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=50,
+        minPoolSize=10,
+        waitQueueTimeoutMS=2000,
+        serverSelectionTimeoutMS=3000,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,16 +49,29 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def get_documents(collection_name: str, filter_dict: dict = None, projection: dict = None,
+                        sort: list = None, skip: int = 0, limit: int = None):
+    """Get documents from collection, optionally projecting only needed fields.
+
+    Runs as an aggregation so the server converts _id to a string via
+    $toString — the driver then receives plain UTF-8 instead of allocating a
+    Python ObjectId per document.
+    """
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-    
-    cursor = db[collection_name].find(filter_dict or {})
+
+    pipeline = [{"$match": filter_dict or {}}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    if skip:
+        pipeline.append({"$skip": skip})
     if limit:
-        cursor = cursor.limit(limit)
-    
-    return list(cursor)
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    pipeline.append({"$addFields": {"_id": {"$toString": "$_id"}}})
+
+    return await db[collection_name].aggregate(pipeline).to_list(limit)
@@ -5,13 +5,13 @@ Each Pydantic model represents a collection in MongoDB.
 Collection name is lowercase of the class name.
 """
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
 class User(BaseModel):
     name: str = Field(..., description="Full name")
-    email: EmailStr = Field(..., description="Unique email")
+    email: str = Field(..., pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$", description="Unique email")
     password_hash: str = Field(..., description="Hashed password")
     role: str = Field("user", description="Role: user | admin")
     is_active: bool = Field(True, description="Active flag")